@@ -0,0 +1,377 @@
+"""
+Color sensor acquisition in a separate process.
+
+Rendering and font rasterization in the scoreboard hold the GIL long enough to
+delay I2C polling, so all ColorSensorV3 polling, ball detection and sensor
+scoring can instead run in a dedicated process pinned to its own core. It
+publishes to the scoreboard through a block of shared memory:
+
+- a header with the cumulative points scored by each sensor and the sensor
+  health, written only by the acquisition process
+- the time until which detections score as auto, written only by the
+  scoreboard
+- a ring of samples and a ring of detection events, written only by the
+  acquisition process
+
+Every record is guarded by a sequence number, seqlock style: the writer makes
+it odd while writing and even when done, and a reader retries when it sees an
+odd number or the number changed while it was reading. Readers unpack
+straight out of the shared buffer.
+
+The acquisition process scores with the last auto deadline it was given, so
+sensing and scoring keep going when the scoreboard hangs, and the scoreboard
+catches up from the cumulative points when it comes back.
+"""
+
+import multiprocessing
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+
+from colorsensorv3 import ColorSample, ColorSensorV3, SensorWatchdog
+
+kSampleSlots = 1024
+kEventSlots = 256
+
+# Sleep between polls, in seconds
+kPollPeriod = 0.005
+
+# A reader gives up on a record after this many torn reads, which only
+# happens if the writer died in the middle of a write
+kMaxRetries = 100
+
+kRed = 0
+kBlue = 1
+kColors = {"red": kRed, "blue": kBlue}
+
+_seq = struct.Struct("<Q")
+
+
+class SeqlockRecord:
+    """A record in shared memory guarded by a sequence number"""
+
+    def __init__(self, buf, offset: int, fmt: str):
+        self._buf = buf
+        self._offset = offset
+        self._payload = struct.Struct(fmt)
+        self.size = _seq.size + self._payload.size
+
+    def write(self, seq: int, *values):
+        """
+        Write a new version of the record. Only one process may write.
+
+        seq     Even sequence number identifying this version
+        values  Payload fields
+        """
+        _seq.pack_into(self._buf, self._offset, seq - 1)
+        self._payload.pack_into(self._buf, self._offset + _seq.size, *values)
+        _seq.pack_into(self._buf, self._offset, seq)
+
+    def read(self):
+        """
+        Returns (seq, payload) from a consistent read, or None if the record
+        could not be read consistently
+        """
+        buf = self._buf
+        offset = self._offset
+        for i in range(kMaxRetries):
+            before = _seq.unpack_from(buf, offset)[0]
+            if before & 1:
+                continue
+            values = self._payload.unpack_from(buf, offset + _seq.size)
+            if _seq.unpack_from(buf, offset)[0] == before:
+                return before, values
+        return None
+
+
+class Ring:
+    """
+    Single-writer, single-reader ring of SeqlockRecords. Slot i holds record
+    number n with sequence number 2 * (n + 1), so a reader can tell a record
+    it has not seen yet from one that was already overwritten.
+    """
+
+    def __init__(self, buf, offset: int, fmt: str, slots: int):
+        self.slots = []
+        for i in range(slots):
+            slot = SeqlockRecord(buf, offset, fmt)
+            self.slots.append(slot)
+            offset = offset + slot.size
+        self.size = offset
+        self.written = 0
+        self.next = 0
+        self.lost = 0
+
+    def write(self, *values):
+        self.slots[self.written % len(self.slots)].write(
+            2 * (self.written + 1), *values
+        )
+        self.written = self.written + 1
+
+    def pending(self) -> bool:
+        """Returns bool indicating if there is a record drain() has not seen"""
+        result = self.slots[self.next % len(self.slots)].read()
+        return result is not None and result[0] // 2 - 1 >= self.next
+
+    def drain(self):
+        """Yields every record written since the last drain, oldest first"""
+        slots = len(self.slots)
+        while True:
+            result = self.slots[self.next % slots].read()
+            if result is None:
+                return
+            seq, values = result
+            index = seq // 2 - 1
+            if index < self.next:
+                return
+            if index > self.next:
+                # the writer lapped us, skip to the oldest record still there
+                self.lost = self.lost + index - slots + 1 - self.next
+                self.next = index - slots + 1
+                continue
+            self.next = self.next + 1
+            yield values
+
+
+class Layout:
+    """Positions of the header fields and rings in the shared memory block"""
+
+    # redPoints, redAutoPoints, bluePoints, blueAutoPoints,
+    # recoveryTime1, recoveryTime2, degraded1, degraded2
+    kStatusFormat = "<4q2d2?"
+    # autoUntil, stop
+    kControlFormat = "<d?"
+    # heartbeat
+    kHeartbeatFormat = "<d"
+    # time, sensor, red, green, blue, ir, proximity, r, g, b normalized
+    kSampleFormat = "<dI5i3d"
+    # time, sensor, color, points
+    kEventFormat = "<dIII"
+
+    def __init__(self, buf):
+        offset = 0
+        self.status = SeqlockRecord(buf, offset, self.kStatusFormat)
+        offset = offset + self.status.size
+        self.control = SeqlockRecord(buf, offset, self.kControlFormat)
+        offset = offset + self.control.size
+        self.heartbeat = SeqlockRecord(buf, offset, self.kHeartbeatFormat)
+        offset = offset + self.heartbeat.size
+        self.samples = Ring(buf, offset, self.kSampleFormat, kSampleSlots)
+        self.events = Ring(buf, self.samples.size, self.kEventFormat, kEventSlots)
+        self.size = self.events.size
+
+    @classmethod
+    def requiredSize(cls) -> int:
+        return cls(bytearray(1 << 20)).size
+
+
+def _setAffinity(cores):
+    """
+    Restrict every thread of this process to cores. sched_setaffinity only
+    applies to the thread it names, threads started later inherit the mask of
+    the thread that starts them.
+    """
+    for task in os.listdir("/proc/self/task"):
+        try:
+            os.sched_setaffinity(int(task), cores)
+        except ProcessLookupError:
+            # the thread exited
+            pass
+
+
+def _health(watchdogs):
+    return (
+        watchdogs[0].lastRecoveryTime,
+        watchdogs[-1].lastRecoveryTime,
+        watchdogs[0].degraded,
+        watchdogs[-1].degraded,
+    )
+
+
+def _acquire(name: str, ports, core, parentPid: int, configure):
+    if core is not None:
+        _setAffinity({core})
+
+    shm = shared_memory.SharedMemory(name)
+    layout = Layout(shm.buf)
+
+    sensors = []
+    watchdogs = []
+    samples = []
+    detectors = []
+    for port, detector in ports:
+        sensor = ColorSensorV3(port)
+        if configure is not None:
+            configure(sensor)
+        sensors.append(sensor)
+        watchdogs.append(SensorWatchdog(sensor))
+        samples.append(ColorSample())
+        detectors.append(detector())
+
+    points = [0, 0, 0, 0]
+    version = 0
+    heartbeat = 0
+    health = None
+    autoUntil = 0.0
+
+    while os.getppid() == parentPid:
+        control = layout.control.read()
+        if control is not None:
+            autoUntil, stop = control[1]
+            if stop:
+                break
+
+        now = time.time()
+        for i in range(len(sensors)):
+            sample = samples[i]
+            watchdog = watchdogs[i]
+            if watchdog.degraded:
+                sample.clear()
+                continue
+
+            try:
+                changed = sensors[i].readSample(sample)
+            except Exception:
+                watchdog.recordError()
+                sample.clear()
+                continue
+            watchdog.recordSuccess()
+
+            raw = sample.raw
+            color = sample.normalized
+            if changed:
+                layout.samples.write(
+                    now, i, raw[0], raw[1], raw[2], raw[3], sample.proximity,
+                    color[0], color[1], color[2],
+                )
+
+            detector = detectors[i]
+            if detector.update(color[0], color[1], color[2]):
+                code = kColors[detector.color]
+                auto = now < autoUntil
+                value = 2 if auto else 1
+                points[2 * code] = points[2 * code] + value
+                if auto:
+                    points[2 * code + 1] = points[2 * code + 1] + value
+                # the points go out before the event, so a scoreboard that
+                # saw the event reads a status that already has them
+                health = _health(watchdogs)
+                version = version + 2
+                layout.status.write(version, *points, *health)
+                layout.events.write(now, i, code, value)
+
+        current = _health(watchdogs)
+        if current != health:
+            health = current
+            version = version + 2
+            layout.status.write(version, *points, *health)
+
+        heartbeat = heartbeat + 2
+        layout.heartbeat.write(heartbeat, now)
+        time.sleep(kPollPeriod)
+
+    shm.close()
+
+
+class AcquisitionProcess:
+    """
+    Scoreboard side of the acquisition process.
+
+    ports      List of (I2C port, BallDetector subclass) for each sensor
+    configure  Optional function applied to each ColorSensorV3 after it is
+               constructed in the acquisition process
+    """
+
+    # The acquisition process counts as stalled after this long without a
+    # heartbeat, in seconds
+    kStallTime = 0.5
+
+    def __init__(self, ports, configure=None):
+        self.shm = shared_memory.SharedMemory(create=True, size=Layout.requiredSize())
+        self.layout = Layout(self.shm.buf)
+        self._controlVersion = 0
+        self._status = (0, 0, 0, 0, 0.0, 0.0, False, False)
+        self.latest = [None] * len(ports)
+
+        core = None
+        cores = os.cpu_count() or 1
+        if hasattr(os, "sched_setaffinity") and cores > 1:
+            # give the last core to acquisition and keep the scoreboard,
+            # including threads it already started such as NetworkTables',
+            # off it
+            core = cores - 1
+            _setAffinity(set(range(core)))
+
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(
+            target=_acquire,
+            args=(self.shm.name, ports, core, os.getpid(), configure),
+            name="acquisition",
+            daemon=True,
+        )
+        self.process.start()
+        self.started = time.time()
+
+    def setAutoUntil(self, autoUntil: float):
+        """
+        Tell the acquisition process until when (time.time()) detections
+        score as auto
+        """
+        self._controlVersion = self._controlVersion + 2
+        self.layout.control.write(self._controlVersion, autoUntil, False)
+
+    def status(self):
+        """
+        Returns (redPoints, redAutoPoints, bluePoints, blueAutoPoints,
+        recoveryTime1, recoveryTime2, degraded1, degraded2). The points are
+        cumulative since the process started.
+        """
+        result = self.layout.status.read()
+        if result is not None and result[0] != 0:
+            self._status = result[1]
+        return self._status
+
+    def events(self):
+        """Yields (time, sensor, color, points) for each new detection"""
+        return self.layout.events.drain()
+
+    def pending(self) -> bool:
+        """Returns bool indicating if there are detections events() has not seen"""
+        return self.layout.events.pending()
+
+    def poll(self):
+        """
+        Read the samples written since the last poll.
+
+        Returns list of the newest sample tuple per sensor, None for a sensor
+        without a new sample
+        """
+        latest = self.latest
+        for i in range(len(latest)):
+            latest[i] = None
+        for sample in self.layout.samples.drain():
+            latest[sample[1]] = sample
+        return latest
+
+    def stalled(self) -> bool:
+        """
+        Returns bool indicating if the acquisition process died or stopped
+        polling, or never started polling
+        """
+        if not self.process.is_alive():
+            return True
+        result = self.layout.heartbeat.read()
+        if result is None or result[0] == 0:
+            return time.time() - self.started > self.kStallTime
+        return time.time() - result[1][0] > self.kStallTime
+
+    def close(self):
+        self._controlVersion = self._controlVersion + 2
+        self.layout.control.write(self._controlVersion, 0.0, True)
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.layout = None
+        self.shm.close()
+        self.shm.unlink()
@@ -0,0 +1,57 @@
+"""
+Pre-rendered animations.
+
+An animation is a sequence of cels, named images that are rendered once ahead
+of time, each shown for a number of fixed length steps. Playback follows the
+clock rather than counting frames, so an animation lasts as long on a slow
+loop as on a fast one, and showing a frame is a single blit of a cel.
+"""
+
+
+class Animation:
+    """
+    A sequence of cels.
+
+    cels      Sequence of (cel name, steps to show it for)
+    stepTime  Seconds per step
+    """
+
+    def __init__(self, cels, stepTime: float):
+        self.steps = []
+        for name, steps in cels:
+            self.steps.extend([name] * steps)
+        self.stepTime = stepTime
+        self.duration = len(self.steps) * stepTime
+
+    def names(self) -> list:
+        """Returns the names of the cels, each once, in order of appearance"""
+        return list(dict.fromkeys(self.steps))
+
+    def at(self, elapsed: float):
+        """Returns the name of the cel shown elapsed seconds in, or None once over"""
+        step = int(max(elapsed, 0) / self.stepTime)
+        if step >= len(self.steps):
+            return None
+        return self.steps[step]
+
+
+class Playback:
+    """Plays one Animation at a time"""
+
+    def __init__(self):
+        self.animation = None
+        self.start = 0
+
+    def play(self, animation: Animation, now: float):
+        """Start animation from its first cel, replacing the one playing"""
+        self.animation = animation
+        self.start = now
+
+    def cel(self, now: float):
+        """Returns the name of the cel shown now, or None if nothing is playing"""
+        if self.animation is None:
+            return None
+        name = self.animation.at(now - self.start)
+        if name is None:
+            self.animation = None
+        return name
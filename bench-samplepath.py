@@ -0,0 +1,169 @@
+#!/usr/bin/python
+
+###############################################################################
+#
+# Benchmark of the sensor sample path.
+#
+# Compares the old per-channel read path (five I2C reads, a RawColor, nested
+# tuples and a list for NT per sample) with ColorSensorV3.readSample() into a
+# reused ColorSample. Runs against a fake pigpio connection that serves an
+# in-memory register file, so it measures only the Python side:
+#   - I2C transactions per sample
+#   - time per sample
+#   - garbage collections and total GC pause time
+#   - peak bytes allocated per sample and memory blocks retained
+#
+# Usage: bench-samplepath.py [samples]
+#
+###############################################################################
+
+import gc
+import sys
+import time
+import tracemalloc
+
+import colorsensorv3
+from colorsensorv3 import ColorSample, ColorSensorV3
+from detection import RedBallDetector
+
+
+class FakePi:
+    """
+    Stands in for pigpio.pi with a register file whose red reading changes
+    on every block read, like a live sensor
+    """
+
+    def __init__(self):
+        self.transactions = 0
+        self.registers = bytearray(0x20)
+        self.registers[ColorSensorV3.Register.kPartID] = ColorSensorV3.kPartID
+        # proximity, then IR, green, blue, red, little endian
+        self.registers[0x08:0x16] = bytes(
+            [0x20, 0x01, 0x10, 0x27, 0, 0x30, 0x75, 0, 0x98, 0x3A, 0, 0x50, 0xC3, 0]
+        )
+
+    def i2c_open(self, port, address):
+        return port
+
+    def i2c_read_byte_data(self, handle, reg):
+        self.transactions += 1
+        return self.registers[reg]
+
+    def i2c_write_byte_data(self, handle, reg, data):
+        self.transactions += 1
+
+    def i2c_read_i2c_block_data(self, handle, reg, count):
+        self.transactions += 1
+        self.registers[ColorSensorV3.Register.kDataRed] ^= 1
+        return count, bytearray(self.registers[reg:reg + count])
+
+
+class GcMonitor:
+    """Counts collections and their pause time through gc.callbacks"""
+
+    def __init__(self):
+        self.collections = 0
+        self.pause = 0.0
+        self._start = 0.0
+
+    def __call__(self, phase, info):
+        if phase == "start":
+            self._start = time.perf_counter()
+        else:
+            self.collections += 1
+            self.pause += time.perf_counter() - self._start
+
+
+def oldPath(sensor, detector, entry):
+    rawcolor = colorsensorv3.RawColor(
+        sensor.getRed(), sensor.getGreen(), sensor.getBlue(), sensor.getIR()
+    )
+    prox = sensor.getProximity()
+    entry.append([rawcolor.red, rawcolor.green, rawcolor.blue, rawcolor.ir])
+    entry.append(prox)
+    entry.clear()
+
+    r = rawcolor.red
+    g = rawcolor.green
+    b = rawcolor.blue
+    mag = r + g + b
+    colors = ((r / mag, g / mag, b / mag), (0, 0, 0))
+    ((r1, g1, b1), (r2, g2, b2)) = colors
+    detector.update(r1, g1, b1)
+
+
+def newPath(sensor, detector, entry, sample):
+    if sensor.readSample(sample):
+        entry.append(sample.raw)
+        entry.append(sample.proximity)
+        entry.clear()
+
+    color = sample.normalized
+    detector.update(color[0], color[1], color[2])
+
+
+def run(name, step, samples):
+    fake = colorsensorv3.pi
+    monitor = GcMonitor()
+
+    # warm up, then time without tracemalloc slowing things down
+    for i in range(1000):
+        step()
+    fake.transactions = 0
+    gc.collect()
+    gc.callbacks.append(monitor)
+    start = time.perf_counter()
+    for i in range(samples):
+        step()
+    elapsed = time.perf_counter() - start
+    gc.callbacks.remove(monitor)
+    transactions = fake.transactions
+
+    # count every allocation, including ones freed within the same sample
+    gc.collect()
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    allocations = 0
+    for i in range(1000):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        step()
+        allocations += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    retained = sys.getallocatedblocks() - blocks
+
+    print(
+        "{:4}: {:.1f} I2C transactions, {:.2f} us, {} bytes peak allocation"
+        " per sample; {} collections, {:.2f} ms GC pause, {} blocks retained"
+        " over {} samples".format(
+            name,
+            transactions / samples,
+            elapsed / samples * 1e6,
+            allocations // 1000,
+            monitor.collections,
+            monitor.pause * 1000,
+            retained,
+            samples,
+        )
+    )
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) >= 2 else 100000
+
+    colorsensorv3.pi = FakePi()
+    sensor = ColorSensorV3(1)
+    entry = []
+
+    detector = RedBallDetector()
+    run("old", lambda: oldPath(sensor, detector, entry), samples)
+
+    detector = RedBallDetector()
+    sample = ColorSample()
+    run("new", lambda: newPath(sensor, detector, entry, sample), samples)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,657 @@
+# Copyright (c) FIRST and other WPILib contributors.
+# Open Source Software; you can modify and/or share it under the terms of
+# the WPILib BSD license file in the root directory of this project.
+
+# Based on https://github.com/REVrobotics/Color-Sensor-v3/blob/main/src/main/java/com/revrobotics/ColorSensorV3.java
+#
+# Copyright (c) 2019 REV Robotics
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of REV Robotics nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+import array
+import enum
+import sys
+import threading
+import time
+
+# pigpio connection, opened by the first ColorSensorV3 so that the classes in
+# this module can be imported on machines without pigpiod
+pi = None
+
+
+class Color:
+
+    __slots__ = ("red", "green", "blue")
+
+    def __init__(self, red: float, green: float, blue: float):
+        self.red = red
+        self.green = green
+        self.blue = blue
+
+
+class RawColor:
+
+    __slots__ = ("red", "green", "blue", "ir")
+
+    def __init__(self, red: int, green: int, blue: int, ir: int):
+        self.red = red
+        self.green = green
+        self.blue = blue
+        self.ir = ir
+
+
+class CIEColor:
+
+    __slots__ = ("x", "y", "z")
+
+    def __init__(self, x: float, y: float, z: float):
+        self.x = x
+        self.y = y
+        self.z = z
+
+
+class ColorSample:
+    """
+    Reusable buffer for one reading from a ColorSensorV3.
+
+    The polling loop allocates one per sensor and ColorSensorV3.readSample()
+    decodes into it every tick, so the decoded values are not allocated anew
+    for every reading. pigpio still returns a new (count, bytearray) result
+    for every I2C read.
+    """
+
+    __slots__ = ("raw", "normalized", "proximity")
+
+    def __init__(self):
+        # red, green, blue, IR, in the same order as sent to NT
+        self.raw = array.array("l", (0, 0, 0, 0))
+        # red, green, blue divided by their sum
+        self.normalized = array.array("d", (0.0, 0.0, 0.0))
+        self.proximity = 0
+
+    def clear(self):
+        """
+        Zero the normalized color, which never looks like a ball, and forget
+        the raw reading so the next read is treated as a change
+        """
+        self.raw[0] = -1
+        normalized = self.normalized
+        normalized[0] = 0.0
+        normalized[1] = 0.0
+        normalized[2] = 0.0
+
+
+class ColorSensorV3:
+    """REV Robotics Color Sensor V3"""
+
+    kAddress = 0x52
+    kPartID = 0xC2
+
+    def __init__(self, port: int):
+        """
+        Constructs a ColorSensor.
+
+        port  The I2C port the color sensor is attached to
+        """
+        global pi
+        if pi is None:
+            import pigpio
+            pi = pigpio.pi()
+
+        self.port = port
+        self.i2c = pi.i2c_open(port, self.kAddress)
+        self.initialized = False
+
+        # Settings passed to the configure methods, re-applied whenever the
+        # device is re-initialized after a reset
+        self._ledConfig = None
+        self._proximityConfig = None
+        self._colorConfig = None
+
+        # A sensor that is unplugged or browned out at boot stays
+        # uninitialized, and its SensorWatchdog keeps trying to bring it up
+        try:
+            if not self._checkDeviceID():
+                return
+
+            self._initializeDevice()
+
+            # Clear the reset flag
+            self.hasReset()
+        except Exception as err:
+            print(
+                "color sensor on port {} did not respond: {}".format(port, err),
+                file=sys.stderr,
+            )
+            return
+        self.initialized = True
+
+    class Register(enum.IntEnum):
+        kMainCtrl = 0x00
+        kProximitySensorLED = 0x01
+        kProximitySensorPulses = 0x02
+        kProximitySensorRate = 0x03
+        kLightSensorMeasurementRate = 0x04
+        kLightSensorGain = 0x05
+        kPartID = 0x06
+        kMainStatus = 0x07
+        kProximityData = 0x08
+        kDataInfrared = 0x0A
+        kDataGreen = 0x0D
+        kDataBlue = 0x10
+        kDataRed = 0x13
+
+    class MainControl(enum.IntFlag):
+        kRGBMode = 0x04  # If bit is set to 1, color channels are activated
+        kLightSensorEnable = 0x02  # Enable light sensor
+        kProximitySensorEnable = 0x01  # Proximity sensor active
+        OFF = 0x00  # Nothing on
+
+    class GainFactor(enum.IntEnum):
+        kGain1x = 0x00
+        kGain3x = 0x01
+        kGain6x = 0x02
+        kGain9x = 0x03
+        kGain18x = 0x04
+
+    class LEDCurrent(enum.IntEnum):
+        kPulse2mA = 0x00
+        kPulse5mA = 0x01
+        kPulse10mA = 0x02
+        kPulse25mA = 0x03
+        kPulse50mA = 0x04
+        kPulse75mA = 0x05
+        kPulse100mA = 0x06  # default value
+        kPulse125mA = 0x07
+
+    class LEDPulseFrequency(enum.IntEnum):
+        kFreq60kHz = 0x18  # default value
+        kFreq70kHz = 0x40
+        kFreq80kHz = 0x28
+        kFreq90kHz = 0x30
+        kFreq100kHz = 0x38
+
+    class ProximitySensorResolution(enum.IntEnum):
+        kProxRes8bit = 0x00
+        kProxRes9bit = 0x08
+        kProxRes10bit = 0x10
+        kProxRes11bit = 0x18
+
+    class ProximitySensorMeasurementRate(enum.IntEnum):
+        kProxRate6ms = 0x01
+        kProxRate12ms = 0x02
+        kProxRate25ms = 0x03
+        kProxRate50ms = 0x04
+        kProxRate100ms = 0x05  # default value
+        kProxRate200ms = 0x06
+        kProxRate400ms = 0x07
+
+    class ColorSensorResolution(enum.IntEnum):
+        kColorSensorRes20bit = 0x00
+        kColorSensorRes19bit = 0x10
+        kColorSensorRes18bit = 0x20
+        kColorSensorRes17bit = 0x30
+        kColorSensorRes16bit = 0x40
+        kColorSensorRes13bit = 0x50
+
+    class ColorSensorMeasurementRate(enum.IntEnum):
+        kColorRate25ms = 0
+        kColorRate50ms = 1
+        kColorRate100ms = 2
+        kColorRate200ms = 3
+        kColorRate500ms = 4
+        kColorRate1000ms = 5
+        kColorRate2000ms = 7
+
+    def configureProximitySensorLED(
+        self, freq: LEDPulseFrequency, curr: LEDCurrent, pulses: int
+    ):
+        """
+        Configure the the IR LED used by the proximity sensor.
+
+        These settings are only needed for advanced users, the defaults
+        will work fine for most teams. Consult the APDS-9151 for more
+        information on these configuration settings and how they will affect
+        proximity sensor measurements.
+
+        freq      The pulse modulation frequency for the proximity
+                  sensor LED
+        curr      The pulse current for the proximity sensor LED
+        pulses    The number of pulses per measurement of the
+                  proximity sensor LED (0-255)
+        """
+        self._ledConfig = (freq, curr, pulses)
+        if self.initialized:
+            self._writeLEDConfig()
+
+    def configureProximitySensor(
+        self, res: ProximitySensorResolution, rate: ProximitySensorMeasurementRate
+    ):
+        """
+        Configure the proximity sensor.
+
+        These settings are only needed for advanced users, the defaults
+        will work fine for most teams. Consult the APDS-9151 for more
+        information on these configuration settings and how they will affect
+        proximity sensor measurements.
+
+        res   Bit resolution output by the proximity sensor ADC.
+        rate  Measurement rate of the proximity sensor
+        """
+        self._proximityConfig = (res, rate)
+        if self.initialized:
+            self._writeProximityConfig()
+
+    def configureColorSensor(
+        self,
+        res: ColorSensorResolution,
+        rate: ColorSensorMeasurementRate,
+        gain: GainFactor,
+    ):
+        """
+        Configure the color sensor.
+
+        These settings are only needed for advanced users, the defaults
+        will work fine for most teams. Consult the APDS-9151 for more
+        information on these configuration settings and how they will affect
+        color sensor measurements.
+
+        res   Bit resolution output by the respective light sensor ADCs
+        rate  Measurement rate of the light sensor
+        gain  Gain factor applied to light sensor (color) outputs
+        """
+        self._colorConfig = (res, rate, gain)
+        if self.initialized:
+            self._writeColorConfig()
+
+    def getColor(self) -> Color:
+        """
+        Get the most likely color. Works best when within 2 inches and
+        perpendicular to surface of interest.
+
+        Returns the most likely color, including unknown if
+        the minimum threshold is not met
+        """
+        r = self.getRed()
+        g = self.getGreen()
+        b = self.getBlue()
+        mag = r + g + b
+        if mag == 0:
+            return Color(0, 0, 0)
+        return Color(r / mag, g / mag, b / mag)
+
+    def getProximity(self):
+        """
+        Get the raw proximity value from the sensor ADC (11 bit). This value
+        is largest when an object is close to the sensor and smallest when
+        far away.
+
+        Returns proximity measurement value, ranging from 0 to 2047
+        """
+        return self._read11BitRegister(self.Register.kProximityData)
+
+    def getRawColor(self) -> RawColor:
+        """
+        Get the raw color values from their respective ADCs (20-bit).
+
+        Returns Color containing red, green, blue and IR values
+        """
+        data = self._readBlock(self.Register.kDataInfrared, 12)
+        return RawColor(
+            self._decode20Bit(data, 9),
+            self._decode20Bit(data, 3),
+            self._decode20Bit(data, 6),
+            self._decode20Bit(data, 0),
+        )
+
+    def readSample(self, sample: ColorSample) -> bool:
+        """
+        Read proximity and all color channels in a single I2C transaction and
+        decode them into sample, normalizing red, green and blue.
+
+        sample  The buffer to decode into
+
+        Returns bool indicating if the reading differs from what sample held
+        """
+        data = self._readBlock(self.Register.kProximityData, 14)
+
+        raw = sample.raw
+        red = self._decode20Bit(data, 11)
+        green = self._decode20Bit(data, 5)
+        blue = self._decode20Bit(data, 8)
+        ir = self._decode20Bit(data, 2)
+        proximity = ((data[0] & 0xFF) | ((data[1] & 0xFF) << 8)) & 0x7FF
+
+        if (
+            raw[0] == red
+            and raw[1] == green
+            and raw[2] == blue
+            and raw[3] == ir
+            and sample.proximity == proximity
+        ):
+            return False
+
+        raw[0] = red
+        raw[1] = green
+        raw[2] = blue
+        raw[3] = ir
+        sample.proximity = proximity
+
+        normalized = sample.normalized
+        mag = red + green + blue
+        if mag == 0:
+            normalized[0] = 0.0
+            normalized[1] = 0.0
+            normalized[2] = 0.0
+        else:
+            normalized[0] = red / mag
+            normalized[1] = green / mag
+            normalized[2] = blue / mag
+        return True
+
+    def getRed(self) -> int:
+        """
+        Get the raw color value from the red ADC
+
+        Returns Red ADC value
+        """
+        return self._read20BitRegister(self.Register.kDataRed)
+
+    def getGreen(self) -> int:
+        """
+        Get the raw color value from the green ADC
+
+        Returns Green ADC value
+        """
+        return self._read20BitRegister(self.Register.kDataGreen)
+
+    def getBlue(self) -> int:
+        """
+        Get the raw color value from the blue ADC
+
+        Returns Blue ADC value
+        """
+        return self._read20BitRegister(self.Register.kDataBlue)
+
+    def getIR(self) -> int:
+        """
+        Get the raw color value from the IR ADC
+
+        Returns IR ADC value
+        """
+        return self._read20BitRegister(self.Register.kDataInfrared)
+
+    # This is a transformation matrix given by the chip
+    # manufacturer to transform the raw RGB to CIE XYZ
+    _Cmatrix = [
+        0.048112847, 0.289453437, -0.084950826, -0.030754752, 0.339680186,
+        -0.071569905, -0.093947499, 0.072838494, 0.34024948
+    ]
+
+    def getCIEColor(self) -> CIEColor:
+        """
+        Get the color converted to CIE XYZ color space using factory
+        calibrated constants.
+
+        https://en.wikipedia.org/wiki/CIE_1931_color_space
+
+        Returns CIEColor value from sensor
+        """
+        raw = self.getRawColor()
+        return CIEColor(
+            self._Cmatrix[0] * raw.red
+            + self._Cmatrix[1] * raw.green
+            + self._Cmatrix[2] * raw.blue,
+            self._Cmatrix[3] * raw.red
+            + self._Cmatrix[4] * raw.green
+            + self._Cmatrix[5] * raw.blue,
+            self._Cmatrix[6] * raw.red
+            + self._Cmatrix[7] * raw.green
+            + self._Cmatrix[8] * raw.blue,
+        )
+
+    def hasReset(self) -> bool:
+        """
+        Indicates if the device reset. Based on the power on status flag in the
+        status register. Per the datasheet:
+
+        Part went through a power-up event, either because the part was turned
+        on or because there was power supply voltage disturbance (default at
+        first register read).
+
+        This flag is self clearing
+
+        Returns bool indicating if the device was reset
+        """
+        raw = pi.i2c_read_byte_data(self.i2c, self.Register.kMainStatus)
+
+        return (raw & 0x20) != 0
+
+    def hasNewColor(self) -> bool:
+        """
+        Indicates if the light sensor finished a measurement since the status
+        register was last read. Reading the status register clears its flags,
+        including the power on flag hasReset() reports.
+
+        Returns bool indicating if there is a new color measurement
+        """
+        raw = pi.i2c_read_byte_data(self.i2c, self.Register.kMainStatus)
+
+        return (raw & 0x08) != 0
+
+    def _checkDeviceID(self, report: bool = True) -> bool:
+        raw = pi.i2c_read_byte_data(self.i2c, self.Register.kPartID)
+
+        if self.kPartID != raw:
+            if report:
+                print("Unknown device found with same I2C addres as REV color sensor")
+            return False
+
+        return True
+
+    def _initializeDevice(self):
+        self._write8(
+            self.Register.kMainCtrl,
+            self.MainControl.kRGBMode
+            | self.MainControl.kLightSensorEnable
+            | self.MainControl.kProximitySensorEnable,
+        )
+
+        self._write8(
+            self.Register.kProximitySensorRate,
+            self.ProximitySensorResolution.kProxRes11bit
+            | self.ProximitySensorMeasurementRate.kProxRate100ms,
+        )
+
+        self._write8(self.Register.kProximitySensorPulses, 32)
+
+        if self._ledConfig is not None:
+            self._writeLEDConfig()
+        if self._proximityConfig is not None:
+            self._writeProximityConfig()
+        if self._colorConfig is not None:
+            self._writeColorConfig()
+
+    def _writeLEDConfig(self):
+        freq, curr, pulses = self._ledConfig
+        self._write8(self.Register.kProximitySensorLED, freq | curr)
+        self._write8(self.Register.kProximitySensorPulses, pulses)
+
+    def _writeProximityConfig(self):
+        res, rate = self._proximityConfig
+        self._write8(self.Register.kProximitySensorRate, res | rate)
+
+    def _writeColorConfig(self):
+        res, rate, gain = self._colorConfig
+        self._write8(self.Register.kLightSensorMeasurementRate, res | rate)
+        self._write8(self.Register.kLightSensorGain, gain)
+
+    def _readBlock(self, reg: Register, length: int):
+        count, raw = pi.i2c_read_i2c_block_data(self.i2c, reg, length)
+        if count != length:
+            raise IOError("short I2C read from register {}: {}".format(reg, count))
+
+        return raw
+
+    @staticmethod
+    def _decode20Bit(raw, offset: int) -> int:
+        return (
+            (raw[offset] & 0xFF)
+            | ((raw[offset + 1] & 0xFF) << 8)
+            | ((raw[offset + 2] & 0xFF) << 16)
+        ) & 0x03FFFF
+
+    def _read11BitRegister(self, reg: Register) -> int:
+        raw = self._readBlock(reg, 2)
+
+        return ((raw[0] & 0xFF) | ((raw[1] & 0xFF) << 8)) & 0x7FF
+
+    def _read20BitRegister(self, reg: Register) -> int:
+        return self._decode20Bit(self._readBlock(reg, 3), 0)
+
+    def _write8(self, reg: Register, data: int):
+        pi.i2c_write_byte_data(self.i2c, reg, data)
+
+
+class SensorWatchdog:
+    """
+    Background health monitor for a ColorSensorV3.
+
+    The polling loop reports the outcome of every read with recordSuccess()
+    and recordError(), which only bump counters. A daemon thread checks the
+    power-on reset flag and the I2C error rate, marks the sensor degraded
+    and re-initializes it with exponential backoff. The polling loop only
+    ever reads the degraded flag, so it never blocks on a recovery.
+
+    The counters only ever go up and the polling loop is their only writer,
+    the thread works on the difference since its last check, so no increment
+    is lost between the two.
+    """
+
+    kCheckPeriod = 0.1
+    kMaxErrorRate = 0.5
+    kMinReadsForRate = 4
+    kMinBackoff = 0.05
+    kMaxBackoff = 2.0
+
+    def __init__(self, sensor: ColorSensorV3):
+        """
+        Constructs a SensorWatchdog and starts its thread.
+
+        sensor  The color sensor to monitor
+        """
+        self.sensor = sensor
+        self.degraded = not sensor.initialized
+        self.degradedSince = time.monotonic() if self.degraded else None
+        self.reads = 0
+        self.errors = 0
+        self.resets = 0
+        self.recoveries = 0
+        self.lastRecoveryTime = 0.0
+        self.maxRecoveryTime = 0.0
+
+        self._thread = threading.Thread(
+            target=self._run, name="watchdog{}".format(sensor.port), daemon=True
+        )
+        self._thread.start()
+
+    def recordSuccess(self):
+        """Report a successful read from the polling loop."""
+        self.reads += 1
+
+    def recordError(self):
+        """Report a failed or garbage read from the polling loop."""
+        self.reads += 1
+        self.errors += 1
+
+    def _run(self):
+        backoff = self.kMinBackoff
+        seenReads = self.reads
+        seenErrors = self.errors
+        while True:
+            if self.degraded:
+                if self._reinitialize():
+                    recoveryTime = time.monotonic() - self.degradedSince
+                    self.lastRecoveryTime = recoveryTime
+                    self.maxRecoveryTime = max(self.maxRecoveryTime, recoveryTime)
+                    self.recoveries += 1
+                    # the error rate starts over with the recovered sensor
+                    seenReads = self.reads
+                    seenErrors = self.errors
+                    self.degraded = False
+                    backoff = self.kMinBackoff
+                    print(
+                        "color sensor on port {} recovered in {:.3f} s".format(
+                            self.sensor.port, recoveryTime
+                        )
+                    )
+                    continue
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.kMaxBackoff)
+                continue
+
+            time.sleep(self.kCheckPeriod)
+
+            totalReads = self.reads
+            totalErrors = self.errors
+            reads = totalReads - seenReads
+            errors = totalErrors - seenErrors
+            seenReads = totalReads
+            seenErrors = totalErrors
+
+            reason = None
+            try:
+                if self.sensor.hasReset():
+                    self.resets += 1
+                    reason = "reset"
+            except Exception:
+                errors += 1
+                reads += 1
+
+            if reason is None and reads >= self.kMinReadsForRate:
+                if errors / reads > self.kMaxErrorRate:
+                    reason = "{} of {} reads failed".format(errors, reads)
+
+            if reason is not None:
+                self.degradedSince = time.monotonic()
+                self.degraded = True
+                print(
+                    "color sensor on port {} degraded: {}".format(
+                        self.sensor.port, reason
+                    ),
+                    file=sys.stderr,
+                )
+
+    def _reinitialize(self) -> bool:
+        try:
+            if not self.sensor._checkDeviceID(report=False):
+                return False
+            self.sensor._initializeDevice()
+            self.sensor.hasReset()
+        except Exception:
+            return False
+        self.sensor.initialized = True
+        return True
@@ -0,0 +1,86 @@
+"""
+Ball detection on normalized color sensor readings.
+
+Each detector watches one sensor and reports a ball once as it crosses. A
+new ball is only reported after two consecutive clear readings, which keeps
+a ball that flickers around the threshold from being counted twice.
+"""
+
+
+class BallDetector:
+    """Edge detector for balls of one color crossing one sensor"""
+
+    color = ""
+
+    def __init__(self):
+        # whether each of the last two readings showed a ball
+        self.last = False
+        self.beforeLast = False
+
+    def isBall(self, r: float, g: float, b: float) -> bool:
+        """Returns whether the reading looks like a ball of this color"""
+        raise NotImplementedError
+
+    def isClear(self, r: float, g: float, b: float) -> bool:
+        """Returns whether the reading shows the ball has left the sensor"""
+        raise NotImplementedError
+
+    def margin(self, r: float, g: float, b: float) -> float:
+        """
+        Returns how far the reading is inside the ball thresholds, negative
+        when it is outside them
+        """
+        raise NotImplementedError
+
+    def update(self, r: float, g: float, b: float) -> bool:
+        """
+        Feed one normalized reading.
+
+        Returns True exactly once per ball crossing
+        """
+        if self.isBall(r, g, b) and not self.last and not self.beforeLast:
+            self.beforeLast = self.last
+            self.last = True
+            return True
+        elif self.isClear(r, g, b):
+            self.beforeLast = self.last
+            self.last = False
+        return False
+
+    def reset(self):
+        self.last = False
+        self.beforeLast = False
+
+
+class RedBallDetector(BallDetector):
+
+    color = "red"
+
+    kMinRed = 0.45
+    kMaxBlue = 0.3
+
+    def isBall(self, r, g, b):
+        return r > self.kMinRed and b < self.kMaxBlue
+
+    def isClear(self, r, g, b):
+        return r < self.kMinRed
+
+    def margin(self, r, g, b):
+        return min(r - self.kMinRed, self.kMaxBlue - b)
+
+
+class BlueBallDetector(BallDetector):
+
+    color = "blue"
+
+    kMaxRed = 0.4
+    kMinBlue = 0.4
+
+    def isBall(self, r, g, b):
+        return r < self.kMaxRed and b > self.kMinBlue
+
+    def isClear(self, r, g, b):
+        return b < self.kMinBlue
+
+    def margin(self, r, g, b):
+        return min(self.kMaxRed - r, b - self.kMinBlue)
@@ -0,0 +1,352 @@
+#!/usr/bin/python
+
+###############################################################################
+#
+# Match state machine fuzzer.
+#
+# Plays randomized matches on a virtual clock: referee keys and detected balls
+# at arbitrary times, frames at irregular intervals with the occasional long
+# stall. Balls are detected both the way the scoreboard polls the sensors
+# itself and the way the acquisition process scores them, with the auto
+# deadline it was given at the last frame. After every step the Match is
+# checked against an independent model of the phases, remaining time, auto
+# deadline and scores.
+#
+#   fuzz-match.py --matches 100000 --seed 1
+#
+# A failing match is reported with its seed and written as a match log that
+# replay-match.py can render.
+#
+###############################################################################
+
+import argparse
+import io
+import math
+import random
+import sys
+import time
+
+from match import Match, VirtualClock
+
+# Floating point slack when comparing remaining time
+kEpsilon = 1e-6
+
+# Referee keys and sensor detections, with how often the fuzzer picks them
+kActions = [
+    (("reset",), 1),
+    (("startTeleop",), 1),
+    (("startOrPause",), 6),
+    (("addScore", "red", 1), 3),
+    (("addScore", "blue", 1), 3),
+    (("addScore", "red", -1), 1),
+    (("addScore", "blue", -1), 1),
+    (("addAutoScore", "red", 2), 1),
+    (("addAutoScore", "blue", 2), 1),
+    (("addAutoScore", "red", -2), 1),
+    (("addAutoScore", "blue", -2), 1),
+    (("addPenalty", "red", 1), 1),
+    (("addPenalty", "blue", 1), 1),
+    (("addPenalty", "red", -1), 1),
+    (("addPenalty", "blue", -1), 1),
+    (("ballDetected", "red"), 5),
+    (("ballDetected", "blue"), 5),
+    # scored by the acquisition process, see play()
+    (("sensorDetected", "red"), 5),
+    (("sensorDetected", "blue"), 5),
+]
+
+# Actions that start, pause or reset a match, after which the auto deadline
+# the acquisition process has is out of date until the next frame
+kPhaseActions = ("reset", "startTeleop", "startOrPause")
+
+
+class InvariantError(Exception):
+    pass
+
+
+class Model:
+    """
+    What the match should look like, from the running time alone.
+
+    Phases are listed as (running time the phase ends at, name).
+    """
+
+    kAutoMatch = [
+        (Match.kAutoLength, "auto"),
+        (Match.kAutoLength + Match.kAutoPauseLength, "autoPause"),
+        (Match.kAutoLength + Match.kAutoPauseLength + Match.kTeleopLength, "teleop"),
+    ]
+    kTeleopMatch = [(Match.kTeleopLength, "teleop")]
+    kAutoEnd = Match.kAutoLength + Match.kAutoPauseLength
+
+    def __init__(self):
+        self.phases = None
+        self.elapsed = 0.0
+        self.paused = False
+        self.ready = True
+        # red score, blue score, red auto, blue auto, red penalties,
+        # blue penalties
+        self.scores = [0, 0, 0, 0, 0, 0]
+
+    def advance(self, seconds: float):
+        if self.phases is not None and not self.paused:
+            self.elapsed = self.elapsed + seconds
+
+    def scoresAuto(self) -> bool:
+        """Returns whether a ball detected now scores as auto"""
+        phase = self.phase()
+        return phase is not None and phase[0] != "teleop"
+
+    def phase(self):
+        """Returns (phase name, running time it ends at), or None when ended"""
+        if self.phases is None:
+            return None
+        for end, name in self.phases:
+            if self.elapsed < end:
+                return name, end
+        return None
+
+    def apply(self, action, *args):
+        scores = self.scores
+        blue = len(args) > 0 and args[0] == "blue"
+        if action == "reset":
+            self.phases = None
+            self.paused = False
+            self.ready = True
+            scores[:] = [0, 0, 0, 0, 0, 0]
+        elif action == "startTeleop":
+            self.phases = self.kTeleopMatch
+            self.elapsed = 0.0
+            self.paused = False
+            self.ready = False
+            scores[:] = [0, 0, scores[2], scores[3], 0, 0]
+        elif action == "startOrPause":
+            if self.phase() is None:
+                self.phases = self.kAutoMatch
+                self.elapsed = 0.0
+                self.paused = False
+                self.ready = False
+                scores[:] = [0, 0, 0, 0, 0, 0]
+            else:
+                self.paused = not self.paused
+        elif action == "addScore":
+            scores[blue] += args[1]
+        elif action == "addAutoScore":
+            scores[blue] += args[1]
+            scores[2 + blue] += args[1]
+        elif action == "addPenalty":
+            scores[4 + blue] += args[1]
+        elif action == "ballDetected":
+            if self.scoresAuto():
+                scores[blue] += 2
+                scores[2 + blue] += 2
+            else:
+                scores[blue] += 1
+        elif action == "addSensorPoints":
+            scores[blue] += args[1]
+            scores[2 + blue] += args[2]
+
+
+def fail(match, model, message: str):
+    raise InvariantError(
+        "{} (running time {:.6f}, auto={} autoPauseActive={} matchRunning={}"
+        " matchReady={} paused={} remaining={:.6f})".format(
+            message,
+            model.elapsed,
+            match.auto,
+            match.autoPauseActive,
+            match.matchRunning,
+            match.matchReady,
+            match.paused,
+            match.remaining(),
+        )
+    )
+
+
+def check(match, model, timing: bool):
+    """
+    Raise InvariantError if match disagrees with model. The phases, the
+    remaining time and the auto deadline only have to be right after an
+    update, as that is when the scoreboard draws them and passes the deadline
+    on to the acquisition process.
+    """
+    if match.auto and match.autoPauseActive:
+        fail(match, model, "auto and auto pause at once")
+    if match.matchReady and match.matchRunning:
+        fail(match, model, "ready while running")
+    if match.paused and not match.matchRunning:
+        fail(match, model, "paused while not running")
+    if (match.auto or match.autoPauseActive) and not match.matchRunning:
+        fail(match, model, "auto phase while not running")
+    if match.matchReady != model.ready:
+        fail(match, model, "matchReady should be {}".format(model.ready))
+    if match.paused != model.paused:
+        fail(match, model, "paused should be {}".format(model.paused))
+
+    scores = [
+        match.redScore,
+        match.blueScore,
+        match.redAutoScore,
+        match.blueAutoScore,
+        match.redPens,
+        match.bluePens,
+    ]
+    if scores != model.scores:
+        fail(match, model, "scores, auto scores and penalties should be {}".format(model.scores))
+
+    if not timing:
+        return
+
+    phase = model.phase()
+    autoUntil = 0.0
+    if phase is not None and phase[0] != "teleop":
+        autoUntil = match.clock() + model.kAutoEnd - model.elapsed
+    if abs(match.autoUntil() - autoUntil) > kEpsilon:
+        fail(match, model, "auto deadline should be {:.6f}".format(autoUntil))
+
+    if phase is None:
+        if match.matchRunning:
+            fail(match, model, "match should have ended")
+        return
+
+    name, end = phase
+    if not match.matchRunning:
+        fail(match, model, "match ended early")
+    if match.auto != (name == "auto"):
+        fail(match, model, "auto should be {}".format(name == "auto"))
+    if match.autoPauseActive != (name == "autoPause"):
+        fail(match, model, "autoPauseActive should be {}".format(name == "autoPause"))
+    if abs(match.remaining() - (end - model.elapsed)) > kEpsilon:
+        fail(match, model, "remaining time should be {:.6f}".format(end - model.elapsed))
+
+
+def play(seed: int, steps: int, log=None):
+    """
+    Play one randomized match.
+
+    Returns the number of steps played, raises InvariantError on failure
+    """
+    rng = random.Random(seed)
+    uniform = rng.random
+    clock = VirtualClock(1024.0)
+    match = Match(clock=clock, log=log)
+    model = Model()
+
+    # Half the matches are calm: they start right away and are never paused,
+    # restarted or reset, so that they play through to the end
+    calm = uniform() < 0.5
+
+    # every action repeated by its weight, so picking one takes one random
+    # number, with the Match method it calls bound up front
+    actions = []
+    for action, weight in kActions:
+        if calm and action[0] in kPhaseActions:
+            continue
+        method = None
+        if action[0] != "sensorDetected":
+            method = getattr(match, action[0])
+        actions.extend([(action, method)] * weight)
+    count = len(actions)
+
+    if calm:
+        start = ("startOrPause",) if uniform() < 0.5 else ("startTeleop",)
+        match.apply(*start)
+        model.apply(*start)
+
+    # what the acquisition process was told at the last frame, and whether a
+    # start, pause or reset made it out of date since
+    autoUntil = 0.0
+    current = False
+
+    for step in range(steps):
+        r = uniform()
+        if r < 0.02:
+            # the scoreboard stalled
+            dt = 1 + 29 * uniform()
+        elif r < 0.2:
+            dt = 0
+        else:
+            # exponentially distributed, 2 s on average
+            dt = -math.log(1.0 - uniform()) * 2
+        # binary fractions of a second add up exactly, so the phase boundaries
+        # of the match and the model agree to the bit
+        dt = round(dt * 1024) / 1024
+        clock.advance(dt)
+        model.advance(dt)
+
+        if uniform() < 0.5:
+            match.update()
+            autoUntil = match.autoUntil()
+            current = True
+            check(match, model, True)
+            continue
+
+        action, method = actions[int(uniform() * count)]
+        name = action[0]
+        if method is not None:
+            method(*action[1:])
+            model.apply(*action)
+            if name in kPhaseActions:
+                current = False
+        else:
+            # the acquisition process scores with the deadline of the last
+            # frame, which is exact unless the match was paused or restarted
+            # since
+            auto = clock.now < autoUntil
+            if current and not model.paused and auto != model.scoresAuto():
+                fail(
+                    match,
+                    model,
+                    "acquisition process scored auto={} with deadline {:.6f}".format(
+                        auto, autoUntil
+                    ),
+                )
+            points = 2 if auto else 1
+            action = ("addSensorPoints", action[1], points, points if auto else 0)
+            match.addSensorPoints(*action[1:])
+            model.apply(*action)
+        check(match, model, False)
+
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzz the match state machine")
+    parser.add_argument("--matches", type=int, default=10000)
+    parser.add_argument("--steps", type=int, default=100, help="steps per match")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first match")
+    parser.add_argument(
+        "--log",
+        default="fuzz-failure.jsonl",
+        help="where to write the match log of a failing match",
+    )
+    args = parser.parse_args()
+
+    began = time.perf_counter()
+    steps = 0
+    for seed in range(args.seed, args.seed + args.matches):
+        try:
+            steps = steps + play(seed, args.steps)
+        except InvariantError as err:
+            print("match with seed {} failed: {}".format(seed, err), file=sys.stderr)
+            log = io.StringIO()
+            try:
+                play(seed, args.steps, log)
+            except InvariantError:
+                pass
+            with open(args.log, "wt", encoding="utf-8") as f:
+                f.write(log.getvalue())
+            print("wrote its match log to '{}'".format(args.log), file=sys.stderr)
+            return 1
+
+    elapsed = time.perf_counter() - began
+    print(
+        "{} matches, {} steps in {:.1f} s ({:.0f} matches/s)".format(
+            args.matches, steps, elapsed, args.matches / elapsed
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Input-to-photon latency of score changes.
+
+Every score change is stamped at its source, the pygame key event or the
+sensor sample that caused it, and stays pending until the first frame that
+shows the scores is flipped to the display. The time between the two is kept
+per source over a sliding window.
+
+pygame does not timestamp key events, so the main loop stamps them at a few
+points per frame with the earliest time they can have arrived. Key latencies
+can come out high by up to the length of the part of the loop a key arrived
+in, sensor polling or drawing, never low.
+"""
+
+import collections
+
+
+class LatencyTracker:
+    """Follows score changes from their source to the frame that shows them"""
+
+    # Number of latencies kept per source
+    kWindow = 1000
+
+    def __init__(self):
+        self.pending = []
+        self.latencies = {}
+
+    def scored(self, source: str, timestamp: float):
+        """
+        Record a score change.
+
+        source     Where it came from, e.g. "key" or "sensor"
+        timestamp  time.time() at the source
+        """
+        self.pending.append((source, timestamp))
+
+    def displayed(self, timestamp: float):
+        """
+        Record that the pending score changes are now on screen.
+
+        timestamp  time.time() just after the display flip
+        """
+        for source, scoredAt in self.pending:
+            if source not in self.latencies:
+                self.latencies[source] = collections.deque(maxlen=self.kWindow)
+            self.latencies[source].append(timestamp - scoredAt)
+        self.pending.clear()
+
+    def percentiles(self, source: str):
+        """
+        Returns [p50, p90, p99, max] latency in seconds for source, or None
+        if nothing from it was displayed yet
+        """
+        latencies = self.latencies.get(source)
+        if not latencies:
+            return None
+
+        ordered = sorted(latencies)
+        last = len(ordered) - 1
+        return [
+            ordered[round(last * 0.5)],
+            ordered[round(last * 0.9)],
+            ordered[round(last * 0.99)],
+            ordered[last],
+        ]
+
+    def report(self) -> str:
+        lines = []
+        for source in sorted(self.latencies):
+            p50, p90, p99, worst = self.percentiles(source)
+            lines.append(
+                "{} to photon over {} changes: p50 {:.1f} ms, p90 {:.1f} ms,"
+                " p99 {:.1f} ms, max {:.1f} ms".format(
+                    source,
+                    len(self.latencies[source]),
+                    p50 * 1000,
+                    p90 * 1000,
+                    p99 * 1000,
+                    worst * 1000,
+                )
+            )
+        return "\n".join(lines)
@@ -0,0 +1,231 @@
+"""
+Match timing and scores.
+
+A match runs auto for 15 s, then a 5 s pause for drivers to pick up their
+controllers, then 135 s of teleop. The match can be paused and resumed at any
+point, and the referees adjust scores, auto scores and penalties by hand.
+
+Every action can be written to a log, one JSON object per line, so a match can
+be replayed later with replay-match.py. Each Match starts its part of the log
+with a "session" entry, so a log appended to across restarts can be split
+back into the runs that wrote it.
+"""
+
+import json
+import time
+
+
+class VirtualClock:
+    """
+    Clock for driving a Match deterministically and faster than real time.
+    Time only moves when it is set or advanced.
+    """
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now = self.now + seconds
+
+
+class Match:
+    """
+    State of the current match.
+
+    clock  Function returning the current time in seconds
+    log    Optional file the actions are written to
+    """
+
+    kAutoLength = 15
+    kAutoPauseLength = 5
+    kTeleopLength = 135
+
+    def __init__(self, clock=time.time, log=None):
+        self.clock = clock
+        self.log = log
+
+        self.auto = False
+        self.autoPauseActive = False
+        self.endTime = clock()
+        self.matchRunning = False
+        self.matchReady = True
+
+        self.paused = False
+        self.pausedTime = 0
+        self.endTimeAtPause = 0
+
+        self.redAutoScore = 0
+        self.blueAutoScore = 0
+        self.redScore = 0
+        self.blueScore = 0
+        self.redPens = 0
+        self.bluePens = 0
+
+        self._record("session")
+
+    def _record(self, action: str, *args):
+        if self.log is not None:
+            self.log.write(
+                json.dumps({"t": self.clock(), "action": action, "args": args}) + "\n"
+            )
+
+    def apply(self, action: str, *args):
+        """Perform an action read back from a match log"""
+        getattr(self, action)(*args)
+
+    def reset(self):
+        """Clear the scores and get ready for the next match"""
+        self._record("reset")
+        self.matchReady = True
+        self.matchRunning = False
+        self.redScore = 0
+        self.blueScore = 0
+        self.redPens = 0
+        self.bluePens = 0
+        self.redAutoScore = 0
+        self.blueAutoScore = 0
+        self.auto = False
+        self.autoPauseActive = False
+        self.paused = False
+
+    def startTeleop(self):
+        """Start a match without auto"""
+        self._record("startTeleop")
+        self.matchReady = False
+        self.auto = False
+        self.autoPauseActive = False
+        self.matchRunning = True
+        self.endTime = self.clock() + self.kTeleopLength
+        self.redScore = 0
+        self.blueScore = 0
+        self.redPens = 0
+        self.bluePens = 0
+        self.paused = False
+
+    def startOrPause(self):
+        """Start a match with auto, or pause or resume the running match"""
+        self._record("startOrPause")
+        # pause or resume exactly where the match is now, not where it was
+        # at the last frame
+        self.update()
+        if not self.matchRunning:
+            self.matchReady = False
+            self.auto = True
+            self.matchRunning = True
+            self.endTime = self.clock() + self.kAutoLength
+            self.redScore = 0
+            self.blueScore = 0
+            self.redPens = 0
+            self.bluePens = 0
+            self.redAutoScore = 0
+            self.blueAutoScore = 0
+            self.paused = False
+        else:
+            self.paused = not self.paused
+            if self.paused:
+                self.pausedTime = self.clock()
+                self.endTimeAtPause = self.endTime
+
+    def addScore(self, color: str, points: int):
+        """Referee score adjustment"""
+        self._record("addScore", color, points)
+        if color == "red":
+            self.redScore = self.redScore + points
+        else:
+            self.blueScore = self.blueScore + points
+
+    def addAutoScore(self, color: str, points: int):
+        """Referee auto score adjustment, which also counts toward the score"""
+        self._record("addAutoScore", color, points)
+        if color == "red":
+            self.redAutoScore = self.redAutoScore + points
+            self.redScore = self.redScore + points
+        else:
+            self.blueAutoScore = self.blueAutoScore + points
+            self.blueScore = self.blueScore + points
+
+    def addPenalty(self, color: str, penalties: int):
+        """Referee penalty adjustment"""
+        self._record("addPenalty", color, penalties)
+        if color == "red":
+            self.redPens = self.redPens + penalties
+        else:
+            self.bluePens = self.bluePens + penalties
+
+    def ballDetected(self, color: str):
+        """A ball crossed a sensor, it scores double during auto"""
+        self._record("ballDetected", color)
+        # score with the phase the match is in now
+        self.update()
+        # if matchRunning and not paused:
+        if self.auto or self.autoPauseActive:
+            points = 2
+            autoPoints = 2
+        else:
+            points = 1
+            autoPoints = 0
+        if color == "red":
+            self.redScore = self.redScore + points
+            self.redAutoScore = self.redAutoScore + autoPoints
+        else:
+            self.blueScore = self.blueScore + points
+            self.blueAutoScore = self.blueAutoScore + autoPoints
+
+    def addSensorPoints(self, color: str, points: int, autoPoints: int):
+        """Points already scored by the acquisition process"""
+        self._record("addSensorPoints", color, points, autoPoints)
+        if color == "red":
+            self.redScore = self.redScore + points
+            self.redAutoScore = self.redAutoScore + autoPoints
+        else:
+            self.blueScore = self.blueScore + points
+            self.blueAutoScore = self.blueAutoScore + autoPoints
+
+    def autoUntil(self) -> float:
+        """Returns the time until which a detected ball scores as auto"""
+        if self.auto:
+            return self.endTime + self.kAutoPauseLength
+        elif self.autoPauseActive:
+            return self.endTime
+        return 0
+
+    def update(self):
+        """
+        Advance the match phases, called once per frame. Each phase ends a
+        fixed time after the previous one ended, however late this is called.
+        """
+        now = self.clock()
+        if self.paused:
+            self.endTime = self.endTimeAtPause + (now - self.pausedTime)
+            return
+
+        while self.matchRunning and self.endTime <= now:
+            if self.auto:
+                self.auto = False
+                self.autoPauseActive = True
+                self.endTime = self.endTime + self.kAutoPauseLength
+            elif self.autoPauseActive:
+                self.autoPauseActive = False
+                self.endTime = self.endTime + self.kTeleopLength
+            else:
+                self.matchRunning = False
+
+    def phase(self) -> str:
+        """Returns the phase shown to the drivers"""
+        if self.matchReady:
+            return "Controllers Down"
+        elif self.autoPauseActive:
+            return "Pick Up Your Controller!"
+        elif self.auto:
+            return "Auto"
+        elif self.matchRunning:
+            return "Drive Your Robot!"
+        else:
+            return "Controllers Down (Match Ended)!"
+
+    def remaining(self) -> float:
+        """Returns the seconds left in the current phase"""
+        return self.endTime - self.clock()
@@ -0,0 +1,178 @@
+#!/usr/bin/python
+
+###############################################################################
+#
+# Headless match replay.
+#
+# Re-runs a match log written by rpi-colorsensor.py (run it with
+# MATCH_LOG=/path/to/log.jsonl) through the same Match and Scoreboard code as
+# the live scoreboard, on a virtual clock and an offscreen surface, and writes
+# the frames that changed as an image sequence:
+#
+#   replay-match.py match.jsonl frames/ --start 10 --end 40
+#
+# A log appended to by several runs of the scoreboard holds one session per
+# run; the last one is replayed unless --session picks another. By default
+# the replay goes on until the last match of the session ended, plus
+# --linger seconds of the end screen.
+#
+# Each image is named after its time in seconds from the start of the session
+# and stays on screen until the next image. Frames are sampled at --fps, which
+# should be close to the frame rate of the live scoreboard. The images are
+# run length encoded TGA by default, which ffmpeg and most viewers read and
+# which saves much faster than PNG.
+#
+###############################################################################
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# render without a window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+from match import Match, VirtualClock
+from scoreboard import Scoreboard, kHeight, kWidth
+
+
+def readLog(path):
+    """
+    Returns list of (start time, log entries) for each session, including
+    runs that logged no actions
+    """
+    sessions = []
+    with open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry["action"] == "session":
+                sessions.append((entry["t"], []))
+                continue
+            if not sessions:
+                # logs from before sessions were marked start with an action
+                sessions.append((entry["t"], []))
+            sessions[-1][1].append(entry)
+    return sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a match log offscreen")
+    parser.add_argument("log", help="match log written with MATCH_LOG")
+    parser.add_argument("output", help="directory for the images")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument(
+        "--session",
+        type=int,
+        default=-1,
+        help="which run of the scoreboard in the log to replay, counting from 0"
+        " and including runs that logged no actions, negative counts from the"
+        " last",
+    )
+    parser.add_argument(
+        "--start", type=float, default=0, help="seconds into the session"
+    )
+    parser.add_argument(
+        "--end",
+        type=float,
+        help="seconds into the session, by default when the last match ended",
+    )
+    parser.add_argument(
+        "--linger",
+        type=float,
+        default=10,
+        help="seconds to keep rendering after the last match ended",
+    )
+    parser.add_argument(
+        "--format",
+        default="tga",
+        help="image file extension, run length encoded tga saves about ten"
+        " times faster than png",
+    )
+    args = parser.parse_args()
+
+    sessions = readLog(args.log)
+    if not sessions:
+        print("'{}' is empty".format(args.log), file=sys.stderr)
+        return 1
+    try:
+        start, entries = sessions[args.session]
+    except IndexError:
+        print(
+            "'{}' has {} sessions, no session {}".format(
+                args.log, len(sessions), args.session
+            ),
+            file=sys.stderr,
+        )
+        return 1
+
+    end = args.end
+    os.makedirs(args.output, exist_ok=True)
+
+    pygame.init()
+    screen = pygame.Surface((kWidth, kHeight))
+    clock = VirtualClock(start)
+    match = Match(clock=clock)
+    scoreboard = Scoreboard()
+
+    began = time.perf_counter()
+    frames = 0
+    written = 0
+    pending = 0
+    frame = 0
+    while True:
+        t = frame / args.fps
+        if end is not None and t > end:
+            break
+        now = start + t
+
+        while pending < len(entries) and entries[pending]["t"] <= now:
+            entry = entries[pending]
+            clock.now = entry["t"]
+            match.update()
+            match.apply(entry["action"], *entry["args"])
+            pending = pending + 1
+        clock.now = now
+        match.update()
+
+        if end is None and pending == len(entries):
+            # a match paused at the end of the log never ends by itself
+            if not match.matchRunning or match.paused:
+                end = t + args.linger
+
+        if t < args.start:
+            # keep the animations in step without rendering
+            scoreboard.frame(match)
+        else:
+            if frames == 0:
+                scoreboard.shown = None
+            if scoreboard.draw(screen, match):
+                pygame.image.save(
+                    screen,
+                    os.path.join(args.output, "{:09.3f}.{}".format(t, args.format)),
+                )
+                written = written + 1
+            frames = frames + 1
+        frame = frame + 1
+
+    print(
+        "rendered {:.1f} s of session {} of {} in {:.1f} s: {} of {} frames"
+        " changed".format(
+            end - args.start,
+            args.session % len(sessions),
+            len(sessions),
+            time.perf_counter() - began,
+            written,
+            frames,
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+Scoreboard drawing.
+
+Each frame is first described as a display list, a tuple of drawing
+operations, and only then rendered. Two frames with the same display list
+look the same, so a frame that did not change can be skipped entirely.
+
+The phase blinks and score flashes are animations whose cels are rendered
+before the match starts, see animation.py.
+"""
+
+import pygame
+
+from animation import Animation, Playback
+
+kWidth = 1920
+kHeight = 1080
+
+# The blinks used to be counted in frames of the main loop, so they got
+# shorter the faster it ran. They now step on the clock, at the 30 frames per
+# second the replay assumes for the live scoreboard.
+kBlinkStep = 1 / 30
+
+# Blink at the start of a phase, shown in place of the scores
+kPhaseAnimations = {
+    "Auto": Animation(
+        (
+            ("Press Your Auto Button!", 5),
+            ("black", 4),
+            ("Press Your Auto Button!", 12),
+            ("black", 4),
+        ),
+        kBlinkStep,
+    ),
+    "Pick Up Your Controller!": Animation(
+        (
+            ("Pick Up Your Controller!", 1),
+            ("Do Not Drive!", 8),
+            ("Pick Up Your Controller!", 8),
+            ("Do Not Drive!", 8),
+        ),
+        kBlinkStep,
+    ),
+}
+
+# Flash when a score goes up. The cel is a circle next to the score and is
+# named after its color, which the score takes while it flashes.
+kRedFlash = Animation((("tomato", 7),), kBlinkStep)
+kBlueFlash = Animation((("dodgerblue", 7),), kBlinkStep)
+kFlashRadius = 50
+
+# Rendered text surfaces kept between frames
+kTextCacheSize = 256
+
+
+class Scoreboard:
+    """Draws a Match, and blinks the phase at phase transitions"""
+
+    def __init__(self):
+        self.fonts = {
+            "score": pygame.font.SysFont("IBM Plex Mono", 500),
+            "timer": pygame.font.SysFont("IBM Plex Mono", 80),
+            "endGame": pygame.font.SysFont("IBM Plex Mono", 750),
+            "phase": pygame.font.SysFont("IBM Plex Mono", 200),
+        }
+
+        self.lastPhase = "Controllers Down"
+        self.currentScreen = "none"
+        self.phaseBlink = Playback()
+        self.redFlash = Playback()
+        self.blueFlash = Playback()
+        self.lastRedScore = 0
+        self.lastBlueScore = 0
+
+        self.shown = None
+        self.cels = None
+        self._text = {}
+
+    def frame(self, match) -> tuple:
+        """
+        Describe the frame of match at the time of its clock.
+
+        Returns the display list: ("text", font, text, color, center) and
+        ("cel", name, center) operations, drawn in order on black, or a
+        single ("screen", name) operation showing a full screen cel
+        """
+        displayed_phase = match.phase()
+        now = match.clock()
+
+        if match.redScore > self.lastRedScore:
+            self.redFlash.play(kRedFlash, now)
+        if match.blueScore > self.lastBlueScore:
+            self.blueFlash.play(kBlueFlash, now)
+        self.lastRedScore = match.redScore
+        self.lastBlueScore = match.blueScore
+
+        if displayed_phase != self.lastPhase and not match.matchReady and displayed_phase != "Controllers Down (Match Ended)!" and displayed_phase != "Drive Your Robot!":
+            self.phaseBlink.play(kPhaseAnimations[displayed_phase], now)
+            self.lastPhase = displayed_phase
+
+        # if displayed_phase == "Controllers Down (Match Ended)!" and displayed_phase != lastPhase:
+        #     mixer.music.load("end.mp3")
+        #     mixer.music.play()
+
+        phaseCel = self.phaseBlink.cel(now)
+        if phaseCel is not None:
+            self.currentScreen = "blinky"
+        else:
+            self.currentScreen = "scores"
+
+        ops = []
+        if self.currentScreen == "scores":
+            remaining = round(match.remaining())
+            displayed_time = str(remaining)
+            if not match.matchRunning:
+                displayed_time = "0"
+            endGame = remaining <= 10 and match.matchRunning and not match.auto
+            if endGame:
+                theFont = "endGame"
+            else:
+                theFont = "timer"
+            if displayed_time == "0" and match.autoPauseActive:
+                displayed_time = "Go!"
+            ops.append(("text", theFont, displayed_time, "white", (kWidth / 2, 800)))
+
+            if not endGame:
+                ops.append(("text", "timer", displayed_phase, "white", (kWidth / 2, 900)))
+
+            if match.paused and not endGame:
+                ops.append(("text", "timer", "Paused", "white", (kWidth / 2, 1000)))
+
+            ops.append(("text", "timer", "Auto: " + str(match.blueAutoScore), "blue", (640, 250)))
+            ops.append(("text", "timer", "Penalty: " + str(match.bluePens), "white", (640, 350)))
+            ops.append(("text", "timer", "Auto: " + str(match.redAutoScore), "red", (kWidth - 640, 250)))
+            ops.append(("text", "timer", "Penalty: " + str(match.redPens), "white", (kWidth - 640, 350)))
+
+            if not match.matchRunning and not match.matchReady:
+                blueTotal = match.blueScore - match.bluePens
+                redTotal = match.redScore - match.redPens
+                if blueTotal > redTotal:
+                    winner_pos = (640, 100)
+                    winner_color = "blue"
+                elif redTotal > blueTotal:
+                    winner_pos = (kWidth - 640, 100)
+                    winner_color = "red"
+                else:
+                    winner_pos = (kWidth / 2, 100)
+                    winner_color = "white"
+                ops.append(("text", "timer", "winner winner chicken dinner", winner_color, winner_pos))
+
+            blueScoreColor = "blue"
+            redScoreColor = "red"
+
+            blueFlashCel = self.blueFlash.cel(now)
+            if blueFlashCel is not None:
+                blueScoreColor = blueFlashCel
+                # Draw circle to the left of the score
+                ops.append(("cel", blueFlashCel, (640 - 300, 650)))
+
+            redFlashCel = self.redFlash.cel(now)
+            if redFlashCel is not None:
+                redScoreColor = redFlashCel
+                # Draw circle to the right of the score
+                ops.append(("cel", redFlashCel, (kWidth - 640 + 300, 650)))
+
+            ops.append(("text", "score", str(match.redScore), redScoreColor, (kWidth - 640, 540)))
+            ops.append(("text", "score", str(match.blueScore), blueScoreColor, (640, 540)))
+
+        elif self.currentScreen == "blinky":
+            ops.append(("screen", phaseCel))
+
+        return tuple(ops)
+
+    def text(self, font: str, text: str, color: str):
+        """Returns the rendered text surface, cached between frames"""
+        key = (font, text, color)
+        surface = self._text.get(key)
+        if surface is None:
+            if len(self._text) >= kTextCacheSize:
+                self._text.clear()
+            surface = self.fonts[font].render(text, True, color)
+            self._text[key] = surface
+        return surface
+
+    def arm(self, screen):
+        """
+        Render the cels of every animation in the format of screen, so that
+        playing them back is a plain blit. The cels are the same for every
+        match, so this only has to happen once, before the first one starts.
+        """
+        self.cels = {}
+        for animation in kPhaseAnimations.values():
+            for name in animation.names():
+                if name in self.cels:
+                    continue
+                cel = pygame.Surface(screen.get_size(), 0, screen)
+                cel.fill("black")
+                if name != "black":
+                    surface = self.fonts["phase"].render(name, True, "white")
+                    cel.blit(surface, surface.get_rect(center=(kWidth / 2, 540)))
+                self.cels[name] = cel
+
+        for animation in (kRedFlash, kBlueFlash):
+            for name in animation.names():
+                cel = pygame.Surface((2 * kFlashRadius, 2 * kFlashRadius), 0, screen)
+                cel.fill("black")
+                cel.set_colorkey("black")
+                pygame.draw.circle(cel, name, (kFlashRadius, kFlashRadius), kFlashRadius)
+                self.cels[name] = cel
+
+    def render(self, screen, ops):
+        if self.cels is None:
+            self.arm(screen)
+
+        if ops and ops[0][0] == "screen":
+            # a full screen cel covers everything, no need to clear first
+            screen.blit(self.cels[ops[0][1]], (0, 0))
+            return
+
+        screen.fill("black")
+        for op in ops:
+            if op[0] == "text":
+                surface = self.text(op[1], op[2], op[3])
+                screen.blit(surface, surface.get_rect(center=op[4]))
+            else:
+                cel = self.cels[op[1]]
+                screen.blit(cel, cel.get_rect(center=op[2]))
+
+    def draw(self, screen, match) -> bool:
+        """
+        Draw the next frame of match onto screen, skipping the rendering if
+        it would look the same as the last frame.
+
+        Returns bool indicating if screen changed
+        """
+        ops = self.frame(match)
+        if ops == self.shown:
+            return False
+
+        self.render(screen, ops)
+        self.shown = ops
+        return True
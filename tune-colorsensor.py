@@ -0,0 +1,568 @@
+#!/usr/bin/python
+
+###############################################################################
+#
+# Color sensor auto-tuner.
+#
+# Finds the fastest color sensor configuration that still tells red balls from
+# blue balls at the venue, and writes it to /boot/colorsensor.json where
+# rpi-colorsensor.py picks it up on start.
+#
+# Recorded traces (tune anywhere, no hardware needed):
+#   tune-colorsensor.py record 1 red.json --seconds 60 --red 10 --blue 10
+#     Polls the sensor on I2C port 1 at the fastest measurement rate while
+#     balls are rolled past it, and records every new reading. --red/--blue
+#     give the number of balls of each color that actually went by.
+#   tune-colorsensor.py sweep red.json blue.json -o colorsensor.json
+#     Replays the traces through a model of every resolution, measurement
+#     rate and gain combination and picks the fastest one that counts every
+#     ball correctly.
+#
+# Real sensor (needs someone to hold balls on the sensor when prompted):
+#   tune-colorsensor.py live 1
+#     Sweeps the color sensor settings against an empty sensor, a red ball and
+#     a blue ball, measuring the achieved sample rate directly and picking the
+#     fastest by it, then sweeps the proximity LED pulse frequency and
+#     current.
+#
+# The LED settings only drive the IR proximity channel, so they are tuned for
+# proximity separation on the real sensor and cannot be derived from traces.
+#
+###############################################################################
+
+import argparse
+import bisect
+import json
+import statistics
+import sys
+import time
+
+from colorsensorv3 import ColorSensorV3
+from detection import BlueBallDetector, RedBallDetector
+
+Res = ColorSensorV3.ColorSensorResolution
+Rate = ColorSensorV3.ColorSensorMeasurementRate
+Gain = ColorSensorV3.GainFactor
+Freq = ColorSensorV3.LEDPulseFrequency
+Current = ColorSensorV3.LEDCurrent
+
+# ADC bits and conversion (integration) time per resolution, from the
+# APDS-9151 datasheet
+kResolutionBits = {
+    Res.kColorSensorRes20bit: 20,
+    Res.kColorSensorRes19bit: 19,
+    Res.kColorSensorRes18bit: 18,
+    Res.kColorSensorRes17bit: 17,
+    Res.kColorSensorRes16bit: 16,
+    Res.kColorSensorRes13bit: 13,
+}
+kConversionTime = {
+    Res.kColorSensorRes20bit: 0.4,
+    Res.kColorSensorRes19bit: 0.2,
+    Res.kColorSensorRes18bit: 0.1,
+    Res.kColorSensorRes17bit: 0.05,
+    Res.kColorSensorRes16bit: 0.025,
+    Res.kColorSensorRes13bit: 0.003125,
+}
+kRatePeriod = {
+    Rate.kColorRate25ms: 0.025,
+    Rate.kColorRate50ms: 0.05,
+    Rate.kColorRate100ms: 0.1,
+    Rate.kColorRate200ms: 0.2,
+    Rate.kColorRate500ms: 0.5,
+    Rate.kColorRate1000ms: 1.0,
+    Rate.kColorRate2000ms: 2.0,
+}
+kGainFactor = {
+    Gain.kGain1x: 1,
+    Gain.kGain3x: 3,
+    Gain.kGain6x: 6,
+    Gain.kGain9x: 9,
+    Gain.kGain18x: 18,
+}
+
+# Traces are recorded at the shortest integration time that still has a
+# 25 ms measurement rate, so every slower configuration can be modeled. The
+# 13 bit resolution integrates for less time, and 1x gain amplifies less,
+# than the reference; both are noisier than the trace shows, so sweeps leave
+# them out.
+kReference = (Res.kColorSensorRes16bit, Rate.kColorRate25ms, Gain.kGain3x)
+
+# Smallest distance from the detection thresholds, in normalized color, that
+# counts as reliable
+kMinMargin = 0.05
+
+kProximityMax = 2047
+kProximityPulses = 32
+
+
+def samplePeriod(config) -> float:
+    res, rate, gain = config
+    return max(kRatePeriod[rate], kConversionTime[res])
+
+
+def configToJson(config):
+    res, rate, gain = config
+    return {"resolution": res.name, "rate": rate.name, "gain": gain.name}
+
+
+def configFromJson(j):
+    return (Res[j["resolution"]], Rate[j["rate"]], Gain[j["gain"]])
+
+
+def allConfigs(maxPeriod: float = None):
+    for res in Res:
+        for rate in Rate:
+            for gain in Gain:
+                config = (res, rate, gain)
+                if maxPeriod is None or samplePeriod(config) <= maxPeriod:
+                    yield config
+
+
+def derivable(config, reference) -> bool:
+    """
+    Returns whether traces recorded with reference can model config, which
+    takes an integration time and a gain at least as large as the
+    reference's. Scaling readings down does not add the noise of a shorter
+    integration or a lower gain.
+    """
+    return (
+        kConversionTime[config[0]] >= kConversionTime[reference[0]]
+        and kGainFactor[config[2]] >= kGainFactor[reference[2]]
+    )
+
+
+def normalize(r, g, b):
+    mag = r + g + b
+    if mag == 0:
+        return (0, 0, 0)
+    return (r / mag, g / mag, b / mag)
+
+
+def simulate(samples, reference, config):
+    """
+    Model what the sensor would have reported with config, given readings
+    recorded with the reference config.
+
+    Each modeled measurement averages the reference readings within its
+    integration window, scales them by the ratio of integration time and gain
+    and clips them to the ADC range.
+
+    Returns list of (time, r, g, b) raw readings
+    """
+    refRes, refRate, refGain = reference
+    res, rate, gain = config
+    integration = kConversionTime[res]
+    period = samplePeriod(config)
+    scale = (integration / kConversionTime[refRes]) * (
+        kGainFactor[gain] / kGainFactor[refGain]
+    )
+    full = (1 << kResolutionBits[res]) - 1
+
+    out = []
+    if not samples:
+        return out
+
+    first = 0
+    last = 0
+    t = samples[0][0] + integration
+    end = samples[-1][0]
+    while t <= end:
+        while last + 1 < len(samples) and samples[last + 1][0] <= t:
+            last = last + 1
+        while first < last and samples[first][0] <= t - integration:
+            first = first + 1
+
+        window = samples[first:last + 1]
+        reading = [t]
+        for channel in (1, 2, 3):
+            value = int(sum(s[channel] for s in window) / len(window) * scale)
+            reading.append(min(value, full))
+        out.append(tuple(reading))
+
+        t = t + period
+    return out
+
+
+def detect(readings):
+    """
+    Run the ball detectors over raw readings.
+
+    Returns list of [time, color, margin] for each detected ball, where margin
+    is the best distance inside the thresholds seen while the ball crossed
+    """
+    detectors = (RedBallDetector(), BlueBallDetector())
+    events = []
+    current = {}
+    for t, r, g, b in readings:
+        rgb = normalize(r, g, b)
+        for detector in detectors:
+            if detector.update(*rgb):
+                event = [t, detector.color, detector.margin(*rgb)]
+                events.append(event)
+                current[detector.color] = event
+            elif detector.color in current:
+                if detector.isBall(*rgb):
+                    event = current[detector.color]
+                    event[2] = max(event[2], detector.margin(*rgb))
+                else:
+                    del current[detector.color]
+    return events
+
+
+def transits(samples, reference):
+    """
+    Find when each ball reached the sensor in a trace recorded with the
+    reference config. The reading that detected a ball is the first to see
+    it, so the ball arrived after the measurement before it: the previous
+    recorded reading, or one sample period earlier if the readings did not
+    change in between.
+
+    Returns list of (arrival time, color)
+    """
+    times = [s[0] for s in samples]
+    period = samplePeriod(reference)
+    result = []
+    for t, color, margin in detect([(s[0], s[1], s[2], s[3]) for s in samples]):
+        i = bisect.bisect_left(times, t)
+        previous = times[i - 1] if i > 0 else t - period
+        result.append((max(previous, t - period), color))
+    return result
+
+
+def evaluate(trace, config):
+    """
+    Score one config against one recorded trace.
+
+    Returns dict with the count errors, worst time from a ball reaching the
+    sensor to its detection and smallest threshold margin
+    """
+    reference = configFromJson(trace["colorSensor"])
+    samples = trace["samples"]
+    truth = transits(samples, reference)
+    events = detect(simulate(samples, reference, config))
+
+    errors = 0
+    for color in ("red", "blue"):
+        expected = trace.get(color)
+        if expected is None:
+            expected = sum(1 for e in truth if e[1] == color)
+        errors = errors + abs(expected - sum(1 for e in events if e[1] == color))
+
+    latency = 0.0
+    margin = min((e[2] for e in events), default=1.0)
+    for color in ("red", "blue"):
+        want = [arrival for arrival, c in truth if c == color]
+        got = [e for e in events if e[1] == color]
+        for arrival in want:
+            match = next((e for e in got if e[0] >= arrival), None)
+            if match is None:
+                continue
+            got.remove(match)
+            latency = max(latency, match[0] - arrival)
+
+    return {
+        "errors": errors,
+        "period": samplePeriod(config),
+        "latency": latency,
+        "margin": margin,
+    }
+
+
+def best(results):
+    """
+    Returns the fastest reliable (config, result), or None if no config
+    counted every ball with enough margin
+    """
+    reliable = [
+        (config, result)
+        for config, result in results
+        if result["errors"] == 0 and result["margin"] >= kMinMargin
+    ]
+    if not reliable:
+        return None
+    return min(
+        reliable,
+        key=lambda cr: (cr[1]["period"], cr[1]["latency"], -cr[1]["margin"]),
+    )
+
+
+def writeResult(path, config, result, led=None):
+    j = {
+        "colorSensor": configToJson(config),
+        "samplePeriod": result["period"],
+        "latency": result["latency"],
+        "margin": result["margin"],
+    }
+    if led is not None:
+        j["proximityLED"] = led
+
+    with open(path, "wt", encoding="utf-8") as f:
+        json.dump(j, f, indent=2)
+        f.write("\n")
+
+    print(
+        "wrote {}: {} {} {} ({:.1f} samples/s, latency {:.3f} s, margin {:.3f})".format(
+            path,
+            config[0].name,
+            config[1].name,
+            config[2].name,
+            1 / result["period"],
+            result["latency"],
+            result["margin"],
+        )
+    )
+
+
+def record(args):
+    sensor = ColorSensorV3(args.port)
+    if not sensor.initialized:
+        return 1
+    sensor.configureColorSensor(*kReference)
+
+    print("recording for {} s, roll the balls past the sensor".format(args.seconds))
+    samples = []
+    last = None
+    readTimes = []
+    start = time.monotonic()
+    while True:
+        before = time.monotonic()
+        if before - start >= args.seconds:
+            break
+        raw = sensor.getRawColor()
+        prox = sensor.getProximity()
+        readTimes.append(time.monotonic() - before)
+
+        values = (raw.red, raw.green, raw.blue, raw.ir)
+        if values != last:
+            samples.append([before - start, *values, prox])
+            last = values
+
+    full = (1 << kResolutionBits[kReference[0]]) - 1
+    if any(max(s[1:4]) >= full for s in samples):
+        print("warning: reference readings saturated, re-record in dimmer light")
+
+    trace = {
+        "port": args.port,
+        "colorSensor": configToJson(kReference),
+        "red": args.red,
+        "blue": args.blue,
+        "samples": samples,
+    }
+    with open(args.trace, "wt", encoding="utf-8") as f:
+        json.dump(trace, f)
+
+    print(
+        "recorded {} readings ({:.1f}/s), I2C poll takes {:.2f} ms".format(
+            len(samples),
+            len(samples) / args.seconds,
+            statistics.mean(readTimes) * 1000,
+        )
+    )
+    return 0
+
+
+def sweep(args):
+    traces = []
+    for path in args.traces:
+        with open(path, "rt", encoding="utf-8") as f:
+            traces.append(json.load(f))
+
+    references = [configFromJson(trace["colorSensor"]) for trace in traces]
+    results = []
+    for config in allConfigs(args.max_period):
+        if not all(derivable(config, reference) for reference in references):
+            continue
+        perTrace = [evaluate(trace, config) for trace in traces]
+        results.append(
+            (
+                config,
+                {
+                    "errors": sum(r["errors"] for r in perTrace),
+                    "period": samplePeriod(config),
+                    "latency": max(r["latency"] for r in perTrace),
+                    "margin": min(r["margin"] for r in perTrace),
+                },
+            )
+        )
+
+    chosen = best(results)
+    if chosen is None:
+        print("no configuration separated red from blue reliably", file=sys.stderr)
+        return 1
+
+    writeResult(args.output, *chosen)
+    return 0
+
+
+def readFresh(sensor, count: int, timeout: float):
+    """
+    Read up to count new color measurements. A measurement is new when the
+    data status flag says so, the values need not change on a steady target.
+
+    Returns (readings, seconds between measurements), the period is None
+    with fewer than two readings
+    """
+    readings = []
+    times = []
+    start = time.monotonic()
+    while len(readings) < count and time.monotonic() - start < timeout:
+        if not sensor.hasNewColor():
+            continue
+        times.append(time.monotonic())
+        raw = sensor.getRawColor()
+        readings.append((raw.red, raw.green, raw.blue))
+
+    period = None
+    if len(times) >= 2:
+        period = (times[-1] - times[0]) / (len(times) - 1)
+    return readings, period
+
+
+def live(args):
+    sensor = ColorSensorV3(args.port)
+    if not sensor.initialized:
+        return 1
+
+    configs = list(allConfigs(args.max_period))
+    red = RedBallDetector()
+    blue = BlueBallDetector()
+    margins = {config: 1.0 for config in configs}
+    periods = {config: 0.0 for config in configs}
+    proximity = {}
+
+    for target in ("empty", "red", "blue"):
+        if target == "empty":
+            input("Clear the sensor and press Enter")
+        else:
+            input("Hold a {} ball on the sensor and press Enter".format(target))
+
+        for config in configs:
+            sensor.configureColorSensor(*config)
+            # throw away the measurement taken with the previous settings
+            readFresh(sensor, 2, 3 * samplePeriod(config))
+            timeout = 8 * samplePeriod(config)
+            readings, period = readFresh(sensor, 5, timeout)
+            if period is None:
+                # too few measurements to time, as slow as it gets
+                period = timeout
+            periods[config] = max(periods[config], period)
+
+            for reading in readings:
+                rgb = normalize(*reading)
+                if target == "red":
+                    margin = min(red.margin(*rgb), -blue.margin(*rgb))
+                elif target == "blue":
+                    margin = min(blue.margin(*rgb), -red.margin(*rgb))
+                else:
+                    margin = min(-red.margin(*rgb), -blue.margin(*rgb))
+                margins[config] = min(margins[config], margin)
+            if not readings:
+                margins[config] = -1.0
+
+        for freq in Freq:
+            for curr in Current:
+                sensor.configureProximitySensorLED(freq, curr, kProximityPulses)
+                # proximity runs at 100 ms, let a fresh measurement land
+                time.sleep(0.2)
+                values = []
+                for i in range(5):
+                    values.append(sensor.getProximity())
+                    time.sleep(0.1)
+                proximity[(freq, curr, target)] = values
+
+    results = [
+        (
+            config,
+            {
+                "errors": 0 if margins[config] > 0 else 1,
+                "period": periods[config],
+                # a ball can arrive just after a measurement started
+                "latency": periods[config] + kConversionTime[config[0]],
+                "margin": margins[config],
+            },
+        )
+        for config in configs
+    ]
+    for config, result in results:
+        print(
+            "{:22} {:17} {:9} {:6.1f} samples/s  margin {:+.3f}".format(
+                config[0].name,
+                config[1].name,
+                config[2].name,
+                1 / max(result["period"], 1e-6),
+                result["margin"],
+            )
+        )
+
+    led = None
+    bestSeparation = None
+    for freq in Freq:
+        for curr in Current:
+            empty = proximity[(freq, curr, "empty")]
+            separation = None
+            for ball in ("red", "blue"):
+                present = proximity[(freq, curr, ball)]
+                if statistics.mean(present) >= 0.95 * kProximityMax:
+                    separation = None
+                    break
+                s = (statistics.mean(present) - statistics.mean(empty)) / (
+                    statistics.pstdev(present) + statistics.pstdev(empty) + 1
+                )
+                separation = s if separation is None else min(separation, s)
+            if separation is None:
+                continue
+            # prefer the lower current on a tie, it is swept in ascending order
+            if bestSeparation is None or separation > bestSeparation:
+                bestSeparation = separation
+                led = {
+                    "frequency": freq.name,
+                    "current": curr.name,
+                    "pulses": kProximityPulses,
+                }
+
+    chosen = best(results)
+    if chosen is None:
+        print("no configuration separated red from blue reliably", file=sys.stderr)
+        return 1
+
+    writeResult(args.output, *chosen, led=led)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the REV color sensor")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("record", help="record a trace from a sensor")
+    p.add_argument("port", type=int, help="I2C port of the sensor")
+    p.add_argument("trace", help="trace file to write")
+    p.add_argument("--seconds", type=float, default=60)
+    p.add_argument("--red", type=int, help="red balls rolled past the sensor")
+    p.add_argument("--blue", type=int, help="blue balls rolled past the sensor")
+    p.set_defaults(func=record)
+
+    p = commands.add_parser("sweep", help="tune against recorded traces")
+    p.add_argument("traces", nargs="+")
+    p.set_defaults(func=sweep)
+
+    p = commands.add_parser("live", help="tune against the real sensor")
+    p.add_argument("port", type=int, help="I2C port of the sensor")
+    p.set_defaults(func=live)
+
+    for p in commands.choices.values():
+        if p.get_default("func") is not record:
+            p.add_argument("-o", "--output", default="/boot/colorsensor.json")
+            p.add_argument(
+                "--max-period",
+                type=float,
+                default=0.2,
+                help="slowest sample period to consider, in seconds",
+            )
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())